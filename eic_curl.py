@@ -1,31 +1,117 @@
 #!/usr/bin/env python3
 import atexit
 import base64
+import fcntl
+import http.client
 import os
 import pwd
 import re
 import shutil
+import signal
 import subprocess
 import sys
 import syslog
 import tempfile
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from urllib.error import HTTPError, URLError
-from urllib.request import Request, urlopen
 
-IMDS_URL = "http://169.254.169.254/latest/meta-data"
-IMDS_TOKEN_URL = "http://169.254.169.254/latest/api/token"
+IMDS_HOST = "169.254.169.254"
+IMDS_PATH = "/latest/meta-data"
+IMDS_TOKEN_PATH = "/latest/api/token"
 IMDS_TIMEOUT = 1
+AUTH_TIMEOUT = 5
+# Multiple of 4 so each slice decodes as whole base64 groups.
+B64_CHUNK = 4096
 TOKEN_HEADER = "X-aws-ec2-metadata-token"
-VALID_DOMAINS = ["amazonaws.com",
-                 "amazonaws.com.cn",
-                 "c2s.ic.gov",
-                 "sc2s.sgov.gov"]
+TOKEN_TTL_SECONDS = 21600
+TOKEN_REFRESH_MARGIN = 60
+TOKEN_CACHE_PATH = "/run/eic-token"
+VALID_DOMAINS = frozenset({"amazonaws.com",
+                           "amazonaws.com.cn",
+                           "c2s.ic.gov",
+                           "sc2s.sgov.gov"})
+
+# Progress output is debug-only: sshd captures AuthorizedKeysCommand
+# stdout, so in production nothing (including the token) is written there.
+DEBUG = os.getenv("EIC_DEBUG") == "1"
+
+
+def debug_print(message):
+    if DEBUG:
+        print(message)
+
+
+# Compiled once at import; these run on every ssh login.
+_INSTANCE_ID_RE = re.compile(r"^i-[0-9a-f]{8,32}$")
+_AZ_RE = re.compile(r"^([a-z]+-){2,3}[0-9][a-z]$")
+
+
+# Buffer log records and emit them in one syslog pass at exit (atexit runs
+# on every sys.exit path), instead of one sendto per log_info call.
+_LOG_BUF = []
+
+
+def _flush_log():
+    if not _LOG_BUF:
+        return
+    syslog.openlog("eic")
+    for priority, message in _LOG_BUF:
+        syslog.syslog(priority, message)
+    del _LOG_BUF[:]
+
+
+atexit.register(_flush_log)
 
 
 def log_info(message):
-    print(f"LOG: {message}")
-    syslog.syslog(syslog.LOG_AUTHPRIV | syslog.LOG_INFO, message)
+    debug_print(f"LOG: {message}")
+    _LOG_BUF.append((syslog.LOG_AUTHPRIV | syslog.LOG_INFO, message))
+
+
+_imds_local = threading.local()
+
+
+def _imds_connection():
+    conn = getattr(_imds_local, "conn", None)
+    if conn is None:
+        conn = http.client.HTTPConnection(IMDS_HOST, timeout=IMDS_TIMEOUT)
+        _imds_local.conn = conn
+    return conn
+
+
+def _imds_request(method, path, token=None, headers=None, retry=True):
+    # One IMDS round-trip over a per-thread keep-alive connection, so only
+    # the first request in each thread pays the TCP handshake. Raises the
+    # urllib error types callers already handle.
+    request_headers = dict(headers) if headers else {}
+    if token:
+        request_headers[TOKEN_HEADER] = token
+    conn = _imds_connection()
+    try:
+        conn.request(method, path, headers=request_headers)
+        response = conn.getresponse()
+        body = response.read()
+    except (OSError, http.client.HTTPException) as e:
+        conn.close()
+        if retry:
+            # The keep-alive socket may have gone stale; reconnect once.
+            return _imds_request(method, path, token, headers, retry=False)
+        raise URLError(e)
+    if response.status >= 400:
+        if response.status in (401, 403) and token and retry:
+            # The token we sent may be a stale or corrupt cache entry;
+            # drop the cache and retry once with a freshly fetched token
+            # so a bad cache file can never keep rejecting logins until
+            # it expires.
+            invalidate_cached_token()
+            return _imds_request(method, path, fetch_token(), headers,
+                                 retry=False)
+        raise HTTPError(f"http://{IMDS_HOST}{path}", response.status,
+                        response.reason, response.headers, None)
+    return body
 
 
 def check_user_exists(username):
@@ -36,29 +122,85 @@ def check_user_exists(username):
         return False
 
 
+def read_cached_token():
+    try:
+        with open(TOKEN_CACHE_PATH, 'r') as file:
+            expiry, token = file.read().split("\n", 1)
+            expiry = int(expiry)
+            token = token.strip()
+    except (OSError, ValueError):
+        return None
+    if token and time.time() < expiry - TOKEN_REFRESH_MARGIN:
+        return token
+    return None
+
+
+def invalidate_cached_token():
+    # A rejected cache entry must not outlive the login that found it bad;
+    # the next fetch_token call then refetches from IMDS.
+    try:
+        os.unlink(TOKEN_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def write_cached_token(token, expiry):
+    # Write-then-rename so concurrent logins never see a partial file.
+    temp_path = f"{TOKEN_CACHE_PATH}.{os.getpid()}"
+    try:
+        fd = os.open(temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        try:
+            os.write(fd, f"{expiry}\n{token}\n".encode("utf-8"))
+        finally:
+            os.close(fd)
+        os.rename(temp_path, TOKEN_CACHE_PATH)
+    except OSError:
+        # Caching is best-effort; the fresh token is still usable.
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
+
 def fetch_token():
+    token = read_cached_token()
+    if token:
+        return token
+    lock_fd = None
     try:
-        request = Request(
-            IMDS_TOKEN_URL,
-            method="PUT",
-            headers={"X-aws-ec2-metadata-token-ttl-seconds": "5"})
-        with urlopen(request, timeout=IMDS_TIMEOUT) as response:
-            token = response.read().decode("utf-8").strip()
+        try:
+            lock_fd = os.open(f"{TOKEN_CACHE_PATH}.lock",
+                              os.O_CREAT | os.O_RDWR, 0o600)
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            # Another login may have refreshed the token while we waited.
+            token = read_cached_token()
+            if token:
+                return token
+        except OSError:
+            pass
+        try:
+            expiry = int(time.time()) + TOKEN_TTL_SECONDS
+            body = _imds_request(
+                "PUT", IMDS_TOKEN_PATH,
+                headers={"X-aws-ec2-metadata-token-ttl-seconds":
+                         str(TOKEN_TTL_SECONDS)})
+            token = body.decode("utf-8").strip()
             if not token:
                 log_info("EC2 Instance Connect failed to get a IMDS token.")
                 sys.exit(255)
+            write_cached_token(token, expiry)
             return token
-    except (URLError, HTTPError):
-        log_info("EC2 Instance Connect failed to establish trust with IMDS.")
-        sys.exit(255)
+        except (URLError, HTTPError):
+            log_info("EC2 Instance Connect failed to establish trust with IMDS.")
+            sys.exit(255)
+    finally:
+        if lock_fd is not None:
+            os.close(lock_fd)
 
 
-def fetch_instance_id(url, token):
+def fetch_instance_id(path, token):
     try:
-        request = Request(url, headers={TOKEN_HEADER: token})
-        with urlopen(request, timeout=IMDS_TIMEOUT) as response:
-            instance_id = response.read().decode("utf-8").strip()
-            return instance_id
+        return _imds_request("GET", path, token).decode("utf-8").strip()
     except (URLError, HTTPError):
         return None
 
@@ -66,183 +208,178 @@ def fetch_instance_id(url, token):
 def verify_instance_id(instance_id):
     if not instance_id or not isinstance(instance_id, str):
         return False
-    return bool(re.match(r"^i-[0-9a-f]{8,32}$", instance_id))
+    return bool(_INSTANCE_ID_RE.match(instance_id))
 
 
-def verify_ec2_instance(instance_id):
-    hypervisor_uuid_path = "/sys/hypervisor/uuid"
-    board_asset_tag_path = "/sys/devices/virtual/dmi/id/board_asset_tag"
+HYPERVISOR_UUID_PATH = "/sys/hypervisor/uuid"
+BOARD_ASSET_TAG_PATH = "/sys/devices/virtual/dmi/id/board_asset_tag"
 
-    if os.path.isfile(hypervisor_uuid_path):
-        # Xen instance
-        print("Xen instance detected")
-        try:
-            with open(hypervisor_uuid_path, 'r') as file:
-                uuid = file.read().strip()
-                print(f"uuid: {uuid}")
-            if uuid.startswith("ec2"):
-                return
-            else:
-                log_info("EC2 Instance Connect was invoked on a non-instance.")
-                sys.exit(0)
-        except (IOError, OSError):
-            log_info("EC2 Instance Connect failed to verify instance.")
-            sys.exit(0)
-    elif os.path.isfile(board_asset_tag_path):
-        # Nitro instance
-        print("Nitro instance detected")
-        try:
-            with open(board_asset_tag_path, 'r') as file:
-                board_asset_tag = file.read().strip()
-                print(f"Board asset tag: {board_asset_tag}")
-            if board_asset_tag == instance_id:
-                return
-            else:
-                log_info("Board asset tag does not match instance ID.")
-                sys.exit(0)
-        except (IOError, OSError):
-            log_info("EC2 Instance Connect failed to verify instance.")
-            sys.exit(0)
-    else:
-        log_info("EC2 Instance Connect was invoked on a non-instance.")
+
+def _read_sysfs(path):
+    # Opening directly doubles as the existence probe, so detection plus
+    # the read costs one syscall path instead of stat + open.
+    try:
+        with open(path, 'r') as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+    except (IOError, OSError):
+        log_info("EC2 Instance Connect failed to verify instance.")
         sys.exit(0)
 
 
-def check_active_keys(username, token):
-    keys_url = f"{IMDS_URL}/managed-ssh-keys/active-keys/{username}/"
-    try:
-        request = Request(
-            keys_url,
-            method="HEAD",
-            headers={TOKEN_HEADER: token}
-        )
-        with urlopen(request, timeout=IMDS_TIMEOUT):
-            return True
-    except HTTPError as e:
-        log_info(f"HTTP error {e.code} while checking for active keys.")
+def detect_hypervisor():
+    # Nitro first: that is the common case, and its probe also yields the
+    # board asset tag needed for verification.
+    board_asset_tag = _read_sysfs(BOARD_ASSET_TAG_PATH)
+    if board_asset_tag is not None:
+        return "nitro", board_asset_tag
+    uuid = _read_sysfs(HYPERVISOR_UUID_PATH)
+    if uuid is not None:
+        return "xen", uuid
+    return "none", None
+
+
+def verify_ec2_instance(hypervisor, instance_id, sysfs_value):
+    if hypervisor == "xen":
+        debug_print("Xen instance detected")
+        debug_print(f"uuid: {sysfs_value}")
+        if sysfs_value.startswith("ec2"):
+            return
+        log_info("EC2 Instance Connect was invoked on a non-instance.")
+        sys.exit(0)
+    elif hypervisor == "nitro":
+        debug_print("Nitro instance detected")
+        debug_print(f"Board asset tag: {sysfs_value}")
+        if sysfs_value == instance_id:
+            return
+        log_info("Board asset tag does not match instance ID.")
         sys.exit(0)
-    except URLError:
-        log_info("Failed to check for active keys")
+    else:
+        log_info("EC2 Instance Connect was invoked on a non-instance.")
         sys.exit(0)
 
 
 def fetch_and_validate_az(token):
-    az_url = f"{IMDS_URL}/placement/availability-zone/"
+    az_path = f"{IMDS_PATH}/placement/availability-zone/"
     try:
-        request = Request(
-            az_url,
-            headers={TOKEN_HEADER: token}
-        )
-        with urlopen(request, timeout=IMDS_TIMEOUT) as response:
-            zone = response.read().decode("utf-8").strip()
-            if not re.match(r"^([a-z]+-){2,3}[0-9][a-z]$", zone):
-                log_info("Invalid availability zone format")
-                sys.exit(255)
-            return zone
+        zone = _imds_request("GET", az_path, token).decode("utf-8").strip()
+        if not _AZ_RE.match(zone):
+            log_info("Invalid availability zone format")
+            sys.exit(255)
+        return zone
     except (URLError, HTTPError):
         log_info("Failed to fetch availability zone")
         sys.exit(255)
 
 
 def extract_region_from_az(zone):
-    match = re.match(r"(([a-z]+-)+[0-9]+)", zone)
-    if match:
-        return match.group(1)
+    # A valid AZ is the region plus one trailing letter, so slicing it off
+    # beats walking the string through the regex engine.
+    if zone and len(zone) >= 2 and zone[-1].isalpha() and zone[-2].isdigit():
+        return zone[:-1]
     return None
 
 
 def fetch_and_validate_domain(token):
-    domain_url = f"{IMDS_URL}/services/domain/"
+    domain_path = f"{IMDS_PATH}/services/domain/"
     try:
-        request = Request(
-            domain_url,
-            headers={TOKEN_HEADER: token}
-        )
-        with urlopen(request, timeout=IMDS_TIMEOUT) as response:
-            domain = response.read().decode("utf-8").strip()
-            if domain not in VALID_DOMAINS:
-                log_info("EC2 Instance Connect found an invalid domain.")
-                sys.exit(255)
-            return domain
+        domain = _imds_request("GET", domain_path, token).decode("utf-8").strip()
+        if domain not in VALID_DOMAINS:
+            log_info("EC2 Instance Connect found an invalid domain.")
+            sys.exit(255)
+        return domain
     except (URLError, HTTPError):
         log_info("Failed to fetch domain from IMDS")
         sys.exit(255)
 
 
-def fetch_signer_cert(region, domain, token):
-    expected_signer = f"managed-ssh-signer.{region}.{domain}"
+def make_userpath():
     userpath = tempfile.mkdtemp(prefix='eic-', dir='/dev/shm')
     atexit.register(lambda: shutil.rmtree(userpath, ignore_errors=True))
+    return userpath
+
+
+def fetch_signer_cert(region, domain, token):
+    expected_signer = f"managed-ssh-signer.{region}.{domain}"
 
-    cert_url = f"{IMDS_URL}/managed-ssh-keys/signer-cert/"
+    cert_path = f"{IMDS_PATH}/managed-ssh-keys/signer-cert/"
     try:
-        request = Request(
-            cert_url,
-            headers={TOKEN_HEADER: token}
-        )
-        with urlopen(request, timeout=IMDS_TIMEOUT) as response:
-            cert = response.read().decode("utf-8").strip()
-            if not cert:
-                log_info("Failed to fetch the certificate")
-                sys.exit(1)
-            return expected_signer, userpath, cert
+        cert = _imds_request("GET", cert_path, token).decode("utf-8").strip()
+        if not cert:
+            log_info("Failed to fetch the certificate")
+            sys.exit(1)
+        return expected_signer, cert
     except (URLError, HTTPError) as e:
         log_info(f"Failed to fetch the signer certificate: {e}")
         sys.exit(1)
 
 
-def fetch_ocsp_staples(userpath, token):
-    staples_url = f"{IMDS_URL}/managed-ssh-keys/signer-ocsp/"
+def fetch_ocsp_staple(ocsp_path, path, token):
+    staple_path = f"{IMDS_PATH}/managed-ssh-keys/signer-ocsp/{path}"
+    try:
+        encoded = b''.join(_imds_request("GET", staple_path, token).split())
+        staple_file = os.path.join(ocsp_path, path)
+        # Create read-only in one syscall instead of open + chmod.
+        fd = os.open(staple_file,
+                     os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o400)
+        try:
+            # Decode and write slice by slice so the whole decoded staple
+            # is never buffered in memory at once.
+            for start in range(0, len(encoded), B64_CHUNK):
+                os.write(fd, base64.b64decode(encoded[start:start + B64_CHUNK]))
+        finally:
+            os.close(fd)
+    except (URLError, HTTPError) as e:
+        log_info(f"Failed to fetch OCSP staple {path}: {e}")
+        sys.exit(1)
+
+
+def fetch_ocsp_staple_list(token):
+    staples_path = f"{IMDS_PATH}/managed-ssh-keys/signer-ocsp/"
     try:
-        request = Request(
-            staples_url,
-            headers={TOKEN_HEADER: token}
-        )
-        with urlopen(request, timeout=IMDS_TIMEOUT) as response:
-            staples_paths = response.read().decode("utf-8").strip()
+        return _imds_request("GET", staples_path,
+                             token).decode("utf-8").strip()
     except (URLError, HTTPError) as e:
         log_info(f"Failed to fetch OCSP staple paths: {e}")
         sys.exit(1)
 
+
+def fetch_ocsp_staples(userpath, token, pool, staples_paths):
     ocsp_path = tempfile.mkdtemp(prefix='eic-ocsp-', dir=userpath)
-    for path in staples_paths.split():
-        staple_url = f"{IMDS_URL}/managed-ssh-keys/signer-ocsp/{path}"
-        try:
-            request = Request(
-                staple_url,
-                headers={TOKEN_HEADER: token}
-            )
-            with urlopen(request, timeout=IMDS_TIMEOUT) as response:
-                decoded_data = base64.b64decode(response.read())
-                staple_file = os.path.join(ocsp_path, path)
-                with open(staple_file, "wb") as file:
-                    file.write(decoded_data)
-                os.chmod(staple_file, 0o400)
-        except (URLError, HTTPError) as e:
-            log_info(f"Failed to fetch OCSP staple {path}: {e}")
-            sys.exit(1)
+    futures = [pool.submit(fetch_ocsp_staple, ocsp_path, path, token)
+               for path in staples_paths.split()]
+    for future in futures:
+        future.result()
     return ocsp_path
 
 
-def fetch_ssh_keys(username, userpath, token):
-    keys_url = f"{IMDS_URL}/managed-ssh-keys/active-keys/{username}/"
-    keys_file = os.path.join(userpath, 'eic-keys')
+def fetch_ssh_keys(username, token):
+    keys_path = f"{IMDS_PATH}/managed-ssh-keys/active-keys/{username}/"
     try:
-        request = Request(
-            keys_url,
-            headers={TOKEN_HEADER: token}
-        )
-        with urlopen(request, timeout=IMDS_TIMEOUT) as response:
-            keys_data = response.read().decode("utf-8")
-            with open(keys_file, 'w') as file:
-                file.write(keys_data)
-            return keys_file
-    except (URLError, HTTPError) as e:
+        # The body stays bytes all the way to the fd; the parser is the
+        # only consumer and reads the file itself.
+        keys_data = _imds_request("GET", keys_path, token)
+        # The keys live in an anonymous memfd handed to the parser as
+        # /proc/self/fd/N, so the material never touches a filesystem
+        # namespace and vanishes with the processes.
+        keys_fd = os.memfd_create("eic-keys")
+        os.write(keys_fd, keys_data)
+        os.lseek(keys_fd, 0, os.SEEK_SET)
+        return keys_fd
+    except HTTPError as e:
+        # 404 means no keys have been pushed for this user; not an error.
+        if e.code == 404:
+            log_info(f"No active keys found for user {username}")
+            sys.exit(0)
+        log_info(f"Failed to fetch SSH keys: {e}")
+        sys.exit(1)
+    except URLError as e:
         log_info(f"Failed to fetch SSH keys: {e}")
         sys.exit(1)
 
 
-def call_parser(keys_file,
+def call_parser(keys_fd,
                 userpath,
                 cert,
                 instance_id,
@@ -255,7 +392,7 @@ def call_parser(keys_file,
     cmd = [
         'python3', parser_script,
         '-x', 'false',
-        '-p', keys_file,
+        '-p', f"/proc/self/fd/{keys_fd}",
         '-o', '/usr/bin/openssl',
         '-d', userpath,
         '-s', cert,
@@ -268,12 +405,18 @@ def call_parser(keys_file,
     if fingerprint:
         cmd.extend(['-f', fingerprint])
 
-    result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-    print(result.stdout, end='')
+    # The parser's output was only ever copied through to stdout, so let
+    # the child inherit our stdout/stderr instead of buffering it in pipes.
+    result = subprocess.run(cmd, check=False, pass_fds=(keys_fd,))
     sys.exit(result.returncode)
 
 
 def main():
+    # Overall deadline, previously enforced by the eic_run wrapper spawning
+    # a second interpreter. Exit 0 on timeout, matching the old wrapper.
+    signal.signal(signal.SIGALRM, lambda signum, frame: sys.exit(0))
+    signal.alarm(AUTH_TIMEOUT)
+
     # Set umask for temp file security
     os.umask(0o077)
 
@@ -282,7 +425,7 @@ def main():
         log_info("EC2 Instance Connect was invoked without a user.")
         sys.exit(1)
     username = sys.argv[1]
-    print(f"Username: {username}")
+    debug_print(f"Username: {username}")
 
     log_info("Verifying username")
     if not check_user_exists(username):
@@ -290,56 +433,72 @@ def main():
 
     log_info("Fetching token from IMDS")
     token = fetch_token()
-    print(f"Token: {token}")
-
-    log_info("Fetching instance ID")
-    instance_id = fetch_instance_id(f"{IMDS_URL}/instance-id/", token)
-    print(f"Instance ID: {instance_id}")
-
-    log_info("Verifying instance ID")
-    if not verify_instance_id(instance_id):
-        log_info("Invalid instance ID")
-        sys.exit(0)
-    print("Instance ID verified")
+    debug_print(f"Token: {token}")
+
+    hypervisor, sysfs_value = detect_hypervisor()
+
+    # The IMDS reads below are independent, so fire each wave concurrently
+    # instead of paying one round-trip per request.
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        instance_id_future = None
+        if hypervisor != "xen":
+            # Xen hosts verify via /sys/hypervisor/uuid and never consume
+            # the instance ID, so that fetch is skipped there.
+            log_info("Fetching instance ID")
+            instance_id_future = pool.submit(
+                fetch_instance_id, f"{IMDS_PATH}/instance-id/", token)
+        az_future = pool.submit(fetch_and_validate_az, token)
+        domain_future = pool.submit(fetch_and_validate_domain, token)
+
+        if instance_id_future is not None:
+            instance_id = instance_id_future.result()
+            debug_print(f"Instance ID: {instance_id}")
+
+            log_info("Verifying instance ID")
+            if not verify_instance_id(instance_id):
+                log_info("Invalid instance ID")
+                sys.exit(0)
+            debug_print("Instance ID verified")
+        else:
+            instance_id = "-"
 
-    log_info("Verifying EC2 instance")
-    verify_ec2_instance(instance_id)
-    print("Instance verified")
+        log_info("Verifying EC2 instance")
+        verify_ec2_instance(hypervisor, instance_id, sysfs_value)
+        debug_print("Instance verified")
 
-    log_info("Checking active keys")
-    if check_active_keys(username, token):
-        print("Active keys found")
-        log_info(f"Active keys found for user {username}")
+        log_info("Validating the AZ")
+        zone = az_future.result()
+        debug_print(f"AZ: {zone}")
 
-    log_info("Validating the AZ")
-    zone = fetch_and_validate_az(token)
-    print(f"AZ: {zone}")
+        region = extract_region_from_az(zone)
+        debug_print(f"Region: {region}")
 
-    region = extract_region_from_az(zone)
-    print(f"Region: {region}")
+        log_info("Validating region and domain")
+        domain = domain_future.result()
+        debug_print(f"Domain: {domain}")
 
-    log_info("Validating region and domain")
-    domain = fetch_and_validate_domain(token)
-    print(f"Domain: {domain}")
+        log_info("Fetching signer certificate, OCSP staples and SSH keys")
+        userpath = make_userpath()
+        cert_future = pool.submit(fetch_signer_cert, region, domain, token)
+        staple_list_future = pool.submit(fetch_ocsp_staple_list, token)
+        keys_future = pool.submit(fetch_ssh_keys, username, token)
 
-    log_info("Fetching signer certificate")
-    expected_signer, userpath, cert = fetch_signer_cert(region, domain, token)
-    print(f"Signer: {expected_signer}")
-    print(f"Userpath: {userpath}")
-    print(f"Cert: Fetched {len(cert)} bytes")
+        expected_signer, cert = cert_future.result()
+        debug_print(f"Signer: {expected_signer}")
+        debug_print(f"Userpath: {userpath}")
+        debug_print(f"Cert: Fetched {len(cert)} bytes")
 
-    log_info("Fetching OCSP staples")
-    ocsp_path = fetch_ocsp_staples(userpath, token)
-    print(f"OCSP path: {ocsp_path}")
+        ocsp_path = fetch_ocsp_staples(userpath, token, pool,
+                                       staple_list_future.result())
+        debug_print(f"OCSP path: {ocsp_path}")
 
-    log_info("Fetching SSH keys")
-    keys_file = fetch_ssh_keys(username, userpath, token)
-    print(f"Keys file: {keys_file}")
+        keys_fd = keys_future.result()
+        debug_print(f"Keys file: /proc/self/fd/{keys_fd}")
 
     log_info("Calling parsing script")
     ca_path = "/etc/ssl/certs"
     fingerprint = sys.argv[2] if len(sys.argv) > 2 else None
-    call_parser(keys_file,
+    call_parser(keys_fd,
                 userpath,
                 cert,
                 instance_id,
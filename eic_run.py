@@ -1,25 +1,25 @@
 #!/usr/bin/env python3
 """
-Wrapper for eic_curl.py with timeout.
+Wrapper for eic_curl.py.
 Necessary for older versions of openssh where AuthorizedKeysCommand must be a filepath.
+eic_curl.py enforces the 5-second deadline itself via SIGALRM, so the wrapper
+replaces its own process instead of forking a second interpreter.
 """
 
 import os
-import subprocess
 import sys
 
-if __name__ == "__main__":
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    script = os.path.join(script_dir, "eic_curl.py")
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(SCRIPT_DIR, "eic_curl.py")
+
 
-    if not os.path.isfile(script):
-        sys.stderr.write(f"Error: {script} not found\n")
+def main():
+    if not os.path.isfile(SCRIPT):
+        sys.stderr.write(f"Error: {SCRIPT} not found\n")
         sys.exit(127)
 
-    command = [sys.executable, script] + sys.argv[1:]
+    os.execv(sys.executable, [sys.executable, SCRIPT] + sys.argv[1:])
 
-    try:
-        result = subprocess.run(command, timeout=5)
-        sys.exit(result.returncode)
-    except subprocess.TimeoutExpired:
-        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
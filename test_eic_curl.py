@@ -1,89 +1,218 @@
 #!/usr/bin/env python3
 """Test script for eic_curl.py - mocks IMDS calls for local testing"""
 
+import base64
+import builtins
+import os
+import pwd
+import shutil
+import signal
 import sys
-import unittest.mock as mock
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from urllib.error import HTTPError
+
+import eic_curl
+
+
+@contextmanager
+def swap_attrs(mapping):
+    """Directly rebind (obj, attr) -> value pairs for the test's duration.
+
+    No test here asserts call bookkeeping on the patched symbols, so plain
+    attribute swaps do the job at a fraction of mock.patch's setup cost.
+    """
+    saved = [(obj, name, getattr(obj, name)) for obj, name in mapping]
+    try:
+        for (obj, name), value in mapping.items():
+            setattr(obj, name, value)
+        yield
+    finally:
+        for obj, name, value in saved:
+            setattr(obj, name, value)
+
+class MockFile:
+    """Stand-in for an open sysfs file handle"""
+    __slots__ = ('content',)
+
+    def __init__(self, content):
+        self.content = content
+
+    def read(self):
+        return self.content
+
+    def strip(self):
+        return self.content.strip()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class MockPwdEntry:
+    """Stand-in for a pwd.struct_passwd entry"""
+    __slots__ = ('pw_name', 'pw_passwd', 'pw_uid', 'pw_gid', 'pw_gecos',
+                 'pw_dir', 'pw_shell')
+
+    def __init__(self, username):
+        self.pw_name = username
+        self.pw_passwd = 'x'
+        self.pw_uid = 1000
+        self.pw_gid = 1000
+        self.pw_gecos = 'Test User'
+        self.pw_dir = f'/home/{username}'
+        self.pw_shell = '/bin/bash'
+
+
+# Shared mock identities; sysfs contents stay str because MockFile mimics
+# text-mode reads, while the IMDS table below is pre-encoded bytes
+TOKEN = b'mock-token-12345'
+INSTANCE_ID = 'i-1234567890abcdef0'
+XEN_UUID = 'ec2abcdef-1234-5678-90ab-cdef12345678'
+WRONG_ID = 'i-WRONGWRONGWRONG'
+BAD_UUID = 'not-ec2-uuid-12345'
+
+# Which sysfs files exist per scenario and what they contain (None = absent)
+SCENARIOS = {
+    'nitro': {'hypervisor/uuid': None,
+              'board_asset_tag': INSTANCE_ID},
+    'xen': {'hypervisor/uuid': XEN_UUID,
+            'board_asset_tag': None},
+    'nitro-invalid': {'hypervisor/uuid': None,
+                      'board_asset_tag': WRONG_ID},  # Mismatched ID
+    'xen-invalid': {'hypervisor/uuid': BAD_UUID,  # Doesn't start with ec2
+                    'board_asset_tag': None},
+    'none': {'hypervisor/uuid': None,
+             'board_asset_tag': None},
+}
+
+
+def make_open(files):
+    """Build a builtins.open mock from a scenario's file table"""
+    items = tuple(files.items())
+
+    def mock_open(path, mode='r'):
+        for k, v in items:
+            if k in path and v is not None:
+                return MockFile(v)
+        raise FileNotFoundError(path)
+    return mock_open
+
+
+# Mock IMDS responses, keyed by the last path segment of each endpoint
+MOCK_STAPLE = base64.b64encode(b'MOCK_OCSP_STAPLE_DATA')
+ENDPOINTS = {
+    'token': TOKEN,
+    'instance-id': INSTANCE_ID.encode(),
+    'testuser': b'',  # active-keys/<username>/
+    'availability-zone': b'us-east-1a',
+    'domain': b'amazonaws.com',
+    'signer-cert': b'-----BEGIN CERTIFICATE-----\nMOCK_CERTIFICATE_DATA\n-----END CERTIFICATE-----',
+    'signer-ocsp': b'staple1 staple2',  # list of staple files
+    'staple1': MOCK_STAPLE,
+    'staple2': MOCK_STAPLE,
+}
+
+
+# Raised by the no-keys mock; built once since nothing mutates it
+NO_KEYS_ERROR = HTTPError('http://169.254.169.254/active-keys', 404,
+                          'Not Found', {}, None)
+
+
+def endpoint(path):
+    """Map an IMDS path to its dispatch key (the last path segment)"""
+    return path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def mock_imds(method, path, token=None, headers=None, retry=True,
+              _get=ENDPOINTS.get, _endpoint=endpoint):
+    """Mock eic_curl._imds_request to simulate IMDS responses.
 
-# Create mock IMDS responses
-def mock_urlopen(request, timeout=None):
-    """Mock urlopen to simulate IMDS responses"""
-    class MockResponse:
-        def __init__(self, data):
-            self.data = data
-
-        def read(self):
-            return self.data.encode('utf-8')
-
-        def __enter__(self):
-            return self
-
-        def __exit__(self, *args):
-            pass
-
-    url = request.get_full_url() if hasattr(request, 'get_full_url') else str(request)
-
-    # Mock token endpoint
-    if 'api/token' in url:
-        return MockResponse('mock-token-12345')
-
-    # Mock instance-id endpoint
-    if 'instance-id' in url:
-        return MockResponse('i-1234567890abcdef0')
-
-    # Mock active-keys endpoint (HEAD request returns empty response with 200 status)
-    if 'active-keys' in url:
-        return MockResponse('')
-
-    # Mock availability zone endpoint
-    if 'availability-zone' in url:
-        return MockResponse('us-east-1a')
-
-    # Mock domain endpoint
-    if 'services/domain' in url:
-        return MockResponse('amazonaws.com')
-
-    # Mock signer-cert endpoint
-    if 'signer-cert' in url:
-        return MockResponse('-----BEGIN CERTIFICATE-----\nMOCK_CERTIFICATE_DATA\n-----END CERTIFICATE-----')
-
-    # Mock signer-ocsp endpoint (list of staple paths)
-    if 'signer-ocsp/' in url and url.endswith('signer-ocsp/'):
-        return MockResponse('staple1 staple2')
-
-    # Mock individual OCSP staple files (base64 encoded)
-    if 'signer-ocsp/staple' in url:
-        import base64
-        mock_data = b'MOCK_OCSP_STAPLE_DATA'
-        return MockResponse(base64.b64encode(mock_data).decode('ascii'))
-
-    return MockResponse('mock-data')
+    _get/_endpoint are pre-bound as defaults to skip the global lookups
+    on every call.
+    """
+    return _get(_endpoint(path), b'mock-data')
 
 
 def mock_getpwnam(username):
     """Mock pwd.getpwnam to simulate user exists"""
-    class MockPwdEntry:
-        pw_name = username
-        pw_passwd = 'x'
-        pw_uid = 1000
-        pw_gid = 1000
-        pw_gecos = 'Test User'
-        pw_dir = f'/home/{username}'
-        pw_shell = '/bin/bash'
-    return MockPwdEntry()
+    return MockPwdEntry(username)
+
+
+BANNER = '=' * 60
+
+
+def emit(lines):
+    """Flush a test's buffered progress lines in a single stdout write"""
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+
+def reset_eic_state():
+    """Reset the module-level state main() mutates between runs.
+
+    The only cross-run state is the buffered syslog lines; everything else
+    main() touches is either patched per-test or process-local (fds, tmpdirs)
+    that each run creates fresh. Clearing the buffer is all a clean start
+    needs, so the old importlib.reload-per-test (a full re-parse and
+    re-execute of the module) is unnecessary.
+
+    The token cache is also pointed at a per-process scratch path: the
+    cache writes go through unpatched os.open/os.rename, so without this
+    a suite run as root would persist the mock token to the production
+    /run/eic-token and break real logins for up to six hours.
+    """
+    del eic_curl._LOG_BUF[:]
+    eic_curl.TOKEN_CACHE_PATH = os.path.join(
+        tempfile.gettempdir(), f'eic-test-token.{os.getpid()}')
+
+
+def run_main():
+    """Call eic_curl.main(), undoing its process-wide side effects.
+
+    main() arms a 5-second alarm whose handler calls sys.exit(0); every
+    exit path it owns leaves the alarm pending. That was harmless when the
+    process ended right after, but a pool worker sitting idle for 5 seconds
+    after its last test would be killed mid-suite, which the executor
+    reports as BrokenProcessPool.
+
+    It also leans on atexit to remove the /dev/shm scratch dirs, and pool
+    workers exit via os._exit without running atexit handlers - so track
+    the dirs this run creates and delete them here. Only our own dirs are
+    removed; a live login's scratch space on a real host is never touched.
+    """
+    created = []
+
+    def tracking_make_userpath(_real=eic_curl.make_userpath):
+        userpath = _real()
+        created.append(userpath)
+        return userpath
+
+    with swap_attrs({(eic_curl, 'make_userpath'): tracking_make_userpath}):
+        try:
+            eic_curl.main()
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+            for userpath in created:
+                shutil.rmtree(userpath, ignore_errors=True)
+            for suffix in ('', '.lock'):
+                try:
+                    os.unlink(eic_curl.TOKEN_CACHE_PATH + suffix)
+                except OSError:
+                    pass
 
 
 def run_test_extract_region():
     """Test extract_region_from_az function with various AZ formats"""
-    print(f"\n{'='*60}")
-    print("Testing extract_region_from_az function")
-    print('='*60)
-
-    import importlib
-    if 'eic_curl' in sys.modules:
-        importlib.reload(sys.modules['eic_curl'])
-        eic_curl = sys.modules['eic_curl']
-    else:
-        import eic_curl
+    out = ['', BANNER, "Testing extract_region_from_az function", BANNER]
+
+    reset_eic_state()
 
     test_cases = [
         ("us-east-1a", "us-east-1"),
@@ -98,683 +227,407 @@ def run_test_extract_region():
     for az, expected_region in test_cases:
         result = eic_curl.extract_region_from_az(az)
         if result == expected_region:
-            print(f"✓ {az} -> {result}")
+            out.append(f"✓ {az} -> {result}")
         else:
-            print(f"✗ {az} -> {result} (expected {expected_region})")
+            out.append(f"✗ {az} -> {result} (expected {expected_region})")
             all_passed = False
 
     if all_passed:
-        print(f"\n✓ All region extraction tests passed!")
-        return True
+        out.append(f"\n✓ All region extraction tests passed!")
     else:
-        print(f"\n✗ Some region extraction tests failed!")
-        return False
+        out.append(f"\n✗ Some region extraction tests failed!")
+    emit(out)
+    return all_passed
 
 
 def run_test_invalid(instance_type):
     """Run test for invalid instance (mismatched ID or bad UUID)"""
-    print(f"\n{'='*60}")
-    print(f"Testing {instance_type} instance type (INVALID - should fail)")
-    print('='*60)
-
-    def mock_isfile_nitro_invalid(path):
-        if 'hypervisor/uuid' in path:
-            return False
-        if 'board_asset_tag' in path:
-            return True
-        return False
-
-    def mock_isfile_xen_invalid(path):
-        if 'hypervisor/uuid' in path:
-            return True
-        if 'board_asset_tag' in path:
-            return False
-        return False
-
-    def mock_open_nitro_invalid(path, mode='r'):
-        class MockFile:
-            def read(self):
-                if 'board_asset_tag' in path:
-                    return 'i-WRONGWRONGWRONG'  # Mismatched ID
-                return ''
-
-            def strip(self):
-                return self.read().strip()
-
-            def __enter__(self):
-                return self
-
-            def __exit__(self, *args):
-                pass
-
-        return MockFile()
-
-    def mock_open_xen_invalid(path, mode='r'):
-        class MockFile:
-            def read(self):
-                if 'hypervisor/uuid' in path:
-                    return 'not-ec2-uuid-12345'  # Doesn't start with ec2
-                return ''
-
-            def strip(self):
-                return self.read().strip()
-
-            def __enter__(self):
-                return self
-
-            def __exit__(self, *args):
-                pass
-
-        return MockFile()
-
-    if instance_type == "Nitro":
-        mock_isfile_func = mock_isfile_nitro_invalid
-        mock_open_func = mock_open_nitro_invalid
-    else:
-        mock_isfile_func = mock_isfile_xen_invalid
-        mock_open_func = mock_open_xen_invalid
-
-    with mock.patch('urllib.request.urlopen', side_effect=mock_urlopen):
-        with mock.patch('os.path.isfile', side_effect=mock_isfile_func):
-            with mock.patch('builtins.open', side_effect=mock_open_func):
-                with mock.patch('pwd.getpwnam', side_effect=mock_getpwnam):
-                    with mock.patch('sys.argv', ['eic_curl.py', 'testuser']):
-                        import importlib
-                        if 'eic_curl' in sys.modules:
-                            importlib.reload(sys.modules['eic_curl'])
-                            eic_curl = sys.modules['eic_curl']
-                        else:
-                            import eic_curl
-
-                        try:
-                            eic_curl.main()
-                            print(f"\n✗ {instance_type} invalid test should have failed but didn't!")
-                            return False
-                        except SystemExit as e:
-                            if e.code == 0:
-                                print(f"\n✓ {instance_type} invalid test correctly rejected (exit 0)")
-                                return True
-                            else:
-                                print(f"\n✗ {instance_type} invalid test failed with unexpected code: {e.code}")
-                                return False
+    out = ['', BANNER,
+           f"Testing {instance_type} instance type (INVALID - should fail)",
+           BANNER]
+
+    files = SCENARIOS['nitro-invalid' if instance_type == "Nitro" else 'xen-invalid']
+
+    reset_eic_state()
+    with swap_attrs({(eic_curl, '_imds_request'): mock_imds,
+                     (builtins, 'open'): make_open(files),
+                     (pwd, 'getpwnam'): mock_getpwnam,
+                     (sys, 'argv'): ['eic_curl.py', 'testuser']}):
+        try:
+            run_main()
+            out.append(f"\n✗ {instance_type} invalid test should have failed but didn't!")
+            passed = False
+        except SystemExit as e:
+            if e.code == 0:
+                out.append(f"\n✓ {instance_type} invalid test correctly rejected (exit 0)")
+                passed = True
+            else:
+                out.append(f"\n✗ {instance_type} invalid test failed with unexpected code: {e.code}")
+                passed = False
+    emit(out)
+    return passed
 
 
 def run_test_user_not_exists():
     """Run test when user doesn't exist"""
-    print(f"\n{'='*60}")
-    print(f"Testing non-existent user (should exit 0)")
-    print('='*60)
+    out = ['', BANNER, f"Testing non-existent user (should exit 0)", BANNER]
 
     def mock_getpwnam_fail(username):
         raise KeyError(f"User {username} not found")
 
-    with mock.patch('pwd.getpwnam', side_effect=mock_getpwnam_fail):
-        with mock.patch('sys.argv', ['eic_curl.py', 'nonexistentuser']):
-            import importlib
-            if 'eic_curl' in sys.modules:
-                importlib.reload(sys.modules['eic_curl'])
-                eic_curl = sys.modules['eic_curl']
+    reset_eic_state()
+    with swap_attrs({(pwd, 'getpwnam'): mock_getpwnam_fail,
+                     (sys, 'argv'): ['eic_curl.py', 'nonexistentuser']}):
+        try:
+            run_main()
+            out.append(f"\n✗ User-not-exists test should have exited!")
+            passed = False
+        except SystemExit as e:
+            if e.code == 0:
+                out.append(f"\n✓ User-not-exists test correctly exited (exit 0)")
+                passed = True
             else:
-                import eic_curl
-
-            try:
-                eic_curl.main()
-                print(f"\n✗ User-not-exists test should have exited!")
-                return False
-            except SystemExit as e:
-                if e.code == 0:
-                    print(f"\n✓ User-not-exists test correctly exited (exit 0)")
-                    return True
-                else:
-                    print(f"\n✗ User-not-exists test failed with unexpected code: {e.code}")
-                    return False
+                out.append(f"\n✗ User-not-exists test failed with unexpected code: {e.code}")
+                passed = False
+    emit(out)
+    return passed
 
 
 def run_test_no_active_keys():
     """Run test when no active keys exist (HTTP 404)"""
-    print(f"\n{'='*60}")
-    print(f"Testing no active keys (HTTP 404 - should exit 0)")
-    print('='*60)
-
-    def mock_urlopen_no_keys(request, timeout=None):
-        """Mock urlopen that returns 404 for active-keys"""
-        from urllib.error import HTTPError
-
-        url = request.get_full_url() if hasattr(request, 'get_full_url') else str(request)
-
-        # Mock token endpoint
-        if 'api/token' in url:
-            class MockResponse:
-                def read(self):
-                    return b'mock-token-12345'
-                def __enter__(self):
-                    return self
-                def __exit__(self, *args):
-                    pass
-            return MockResponse()
-
-        # Mock instance-id endpoint
-        if 'instance-id' in url:
-            class MockResponse:
-                def read(self):
-                    return b'i-1234567890abcdef0'
-                def __enter__(self):
-                    return self
-                def __exit__(self, *args):
-                    pass
-            return MockResponse()
-
-        # Mock active-keys endpoint - return 404
-        if 'active-keys' in url:
-            raise HTTPError(url, 404, 'Not Found', {}, None)
-
-        class MockResponse:
-            def read(self):
-                return b'mock-data'
-            def __enter__(self):
-                return self
-            def __exit__(self, *args):
-                pass
-        return MockResponse()
-
-    def mock_isfile_nitro(path):
-        if 'hypervisor/uuid' in path:
-            return False
-        if 'board_asset_tag' in path:
-            return True
-        return False
-
-    def mock_open_nitro(path, mode='r'):
-        class MockFile:
-            def read(self):
-                if 'board_asset_tag' in path:
-                    return 'i-1234567890abcdef0'
-                return ''
-            def strip(self):
-                return self.read().strip()
-            def __enter__(self):
-                return self
-            def __exit__(self, *args):
-                pass
-        return MockFile()
-
-    with mock.patch('urllib.request.urlopen', side_effect=mock_urlopen_no_keys):
-        with mock.patch('os.path.isfile', side_effect=mock_isfile_nitro):
-            with mock.patch('builtins.open', side_effect=mock_open_nitro):
-                with mock.patch('pwd.getpwnam', side_effect=mock_getpwnam):
-                    with mock.patch('sys.argv', ['eic_curl.py', 'testuser']):
-                        import importlib
-                        if 'eic_curl' in sys.modules:
-                            importlib.reload(sys.modules['eic_curl'])
-                            eic_curl = sys.modules['eic_curl']
-                        else:
-                            import eic_curl
-
-                        try:
-                            eic_curl.main()
-                            print(f"\n✗ No-keys test should have exited!")
-                            return False
-                        except SystemExit as e:
-                            if e.code == 0:
-                                print(f"\n✓ No-keys test correctly exited (exit 0)")
-                                return True
-                            else:
-                                print(f"\n✗ No-keys test failed with unexpected code: {e.code}")
-                                return False
+    out = ['', BANNER, f"Testing no active keys (HTTP 404 - should exit 0)", BANNER]
+
+    def mock_imds_no_keys(method, path, token=None, headers=None, retry=True):
+        """Mock _imds_request that returns 404 for active-keys"""
+        if 'active-keys' in path:
+            raise NO_KEYS_ERROR
+
+        return mock_imds(method, path, token, headers, retry)
+
+    files = SCENARIOS['nitro']
+
+    reset_eic_state()
+    with swap_attrs({(eic_curl, '_imds_request'): mock_imds_no_keys,
+                     (builtins, 'open'): make_open(files),
+                     (pwd, 'getpwnam'): mock_getpwnam,
+                     (sys, 'argv'): ['eic_curl.py', 'testuser']}):
+        try:
+            run_main()
+            out.append(f"\n✗ No-keys test should have exited!")
+            passed = False
+        except SystemExit as e:
+            if e.code == 0:
+                out.append(f"\n✓ No-keys test correctly exited (exit 0)")
+                passed = True
+            else:
+                out.append(f"\n✗ No-keys test failed with unexpected code: {e.code}")
+                passed = False
+    emit(out)
+    return passed
 
 
 def run_test_invalid_az():
     """Run test with invalid availability zone format"""
-    print(f"\n{'='*60}")
-    print(f"Testing invalid AZ format (should exit 255)")
-    print('='*60)
-
-    def mock_urlopen_invalid_az(request, timeout=None):
-        """Mock urlopen that returns invalid AZ format"""
-        class MockResponse:
-            def __init__(self, data):
-                self.data = data
-            def read(self):
-                return self.data.encode('utf-8')
-            def __enter__(self):
-                return self
-            def __exit__(self, *args):
-                pass
-
-        url = request.get_full_url() if hasattr(request, 'get_full_url') else str(request)
-
-        if 'api/token' in url:
-            return MockResponse('mock-token-12345')
-        if 'instance-id' in url:
-            return MockResponse('i-1234567890abcdef0')
-        if 'active-keys' in url:
-            return MockResponse('')
-        if 'availability-zone' in url:
+    out = ['', BANNER, f"Testing invalid AZ format (should exit 255)", BANNER]
+
+    def mock_imds_invalid_az(method, path, token=None, headers=None, retry=True):
+        """Mock _imds_request that returns invalid AZ format"""
+        if endpoint(path) == 'availability-zone':
             # Invalid format - should match ^([a-z]+-){2,3}[0-9][a-z]$
-            return MockResponse('INVALID-ZONE-123')
-        return MockResponse('mock-data')
-
-    def mock_isfile_nitro(path):
-        if 'hypervisor/uuid' in path:
-            return False
-        if 'board_asset_tag' in path:
-            return True
-        return False
-
-    def mock_open_nitro(path, mode='r'):
-        class MockFile:
-            def read(self):
-                if 'board_asset_tag' in path:
-                    return 'i-1234567890abcdef0'
-                return ''
-            def strip(self):
-                return self.read().strip()
-            def __enter__(self):
-                return self
-            def __exit__(self, *args):
-                pass
-        return MockFile()
-
-    with mock.patch('urllib.request.urlopen', side_effect=mock_urlopen_invalid_az):
-        with mock.patch('os.path.isfile', side_effect=mock_isfile_nitro):
-            with mock.patch('builtins.open', side_effect=mock_open_nitro):
-                with mock.patch('pwd.getpwnam', side_effect=mock_getpwnam):
-                    with mock.patch('sys.argv', ['eic_curl.py', 'testuser']):
-                        import importlib
-                        if 'eic_curl' in sys.modules:
-                            importlib.reload(sys.modules['eic_curl'])
-                            eic_curl = sys.modules['eic_curl']
-                        else:
-                            import eic_curl
-
-                        try:
-                            eic_curl.main()
-                            print(f"\n✗ Invalid AZ test should have exited with 255!")
-                            return False
-                        except SystemExit as e:
-                            if e.code == 255:
-                                print(f"\n✓ Invalid AZ test correctly exited (exit 255)")
-                                return True
-                            else:
-                                print(f"\n✗ Invalid AZ test failed with unexpected code: {e.code}")
-                                return False
+            return b'INVALID-ZONE-123'
+        return mock_imds(method, path, token, headers, retry)
+
+    files = SCENARIOS['nitro']
+
+    reset_eic_state()
+    with swap_attrs({(eic_curl, '_imds_request'): mock_imds_invalid_az,
+                     (builtins, 'open'): make_open(files),
+                     (pwd, 'getpwnam'): mock_getpwnam,
+                     (sys, 'argv'): ['eic_curl.py', 'testuser']}):
+        try:
+            run_main()
+            out.append(f"\n✗ Invalid AZ test should have exited with 255!")
+            passed = False
+        except SystemExit as e:
+            if e.code == 255:
+                out.append(f"\n✓ Invalid AZ test correctly exited (exit 255)")
+                passed = True
+            else:
+                out.append(f"\n✗ Invalid AZ test failed with unexpected code: {e.code}")
+                passed = False
+    emit(out)
+    return passed
 
 
 def run_test_invalid_domain():
     """Run test with invalid domain (should exit 255)"""
-    print(f"\n{'='*60}")
-    print(f"Testing invalid domain (should exit 255)")
-    print('='*60)
-
-    def mock_urlopen_invalid_domain(request, timeout=None):
-        """Mock urlopen that returns invalid domain"""
-        class MockResponse:
-            def __init__(self, data):
-                self.data = data
-            def read(self):
-                return self.data.encode('utf-8')
-            def __enter__(self):
-                return self
-            def __exit__(self, *args):
-                pass
-
-        url = request.get_full_url() if hasattr(request, 'get_full_url') else str(request)
-
-        if 'api/token' in url:
-            return MockResponse('mock-token-12345')
-        if 'instance-id' in url:
-            return MockResponse('i-1234567890abcdef0')
-        if 'active-keys' in url:
-            return MockResponse('')
-        if 'availability-zone' in url:
-            return MockResponse('us-east-1a')
-        if 'services/domain' in url:
+    out = ['', BANNER, f"Testing invalid domain (should exit 255)", BANNER]
+
+    def mock_imds_invalid_domain(method, path, token=None, headers=None, retry=True):
+        """Mock _imds_request that returns invalid domain"""
+        if endpoint(path) == 'domain':
             # Invalid domain - not in VALID_DOMAINS list
-            return MockResponse('invalid-domain.com')
-        return MockResponse('mock-data')
-
-    def mock_isfile_nitro(path):
-        if 'hypervisor/uuid' in path:
-            return False
-        if 'board_asset_tag' in path:
-            return True
-        return False
-
-    def mock_open_nitro(path, mode='r'):
-        class MockFile:
-            def read(self):
-                if 'board_asset_tag' in path:
-                    return 'i-1234567890abcdef0'
-                return ''
-            def strip(self):
-                return self.read().strip()
-            def __enter__(self):
-                return self
-            def __exit__(self, *args):
-                pass
-        return MockFile()
-
-    with mock.patch('urllib.request.urlopen', side_effect=mock_urlopen_invalid_domain):
-        with mock.patch('os.path.isfile', side_effect=mock_isfile_nitro):
-            with mock.patch('builtins.open', side_effect=mock_open_nitro):
-                with mock.patch('pwd.getpwnam', side_effect=mock_getpwnam):
-                    with mock.patch('sys.argv', ['eic_curl.py', 'testuser']):
-                        import importlib
-                        if 'eic_curl' in sys.modules:
-                            importlib.reload(sys.modules['eic_curl'])
-                            eic_curl = sys.modules['eic_curl']
-                        else:
-                            import eic_curl
-
-                        try:
-                            eic_curl.main()
-                            print(f"\n✗ Invalid domain test should have exited with 255!")
-                            return False
-                        except SystemExit as e:
-                            if e.code == 255:
-                                print(f"\n✓ Invalid domain test correctly exited (exit 255)")
-                                return True
-                            else:
-                                print(f"\n✗ Invalid domain test failed with unexpected code: {e.code}")
-                                return False
+            return b'invalid-domain.com'
+        return mock_imds(method, path, token, headers, retry)
+
+    files = SCENARIOS['nitro']
+
+    reset_eic_state()
+    with swap_attrs({(eic_curl, '_imds_request'): mock_imds_invalid_domain,
+                     (builtins, 'open'): make_open(files),
+                     (pwd, 'getpwnam'): mock_getpwnam,
+                     (sys, 'argv'): ['eic_curl.py', 'testuser']}):
+        try:
+            run_main()
+            out.append(f"\n✗ Invalid domain test should have exited with 255!")
+            passed = False
+        except SystemExit as e:
+            if e.code == 255:
+                out.append(f"\n✓ Invalid domain test correctly exited (exit 255)")
+                passed = True
+            else:
+                out.append(f"\n✗ Invalid domain test failed with unexpected code: {e.code}")
+                passed = False
+    emit(out)
+    return passed
 
 
 def run_test_empty_cert():
     """Run test when signer certificate is empty (should exit 1)"""
-    print(f"\n{'='*60}")
-    print(f"Testing empty signer certificate (should exit 1)")
-    print('='*60)
-
-    def mock_urlopen_empty_cert(request, timeout=None):
-        """Mock urlopen that returns empty certificate"""
-        class MockResponse:
-            def __init__(self, data):
-                self.data = data
-            def read(self):
-                return self.data.encode('utf-8')
-            def __enter__(self):
-                return self
-            def __exit__(self, *args):
-                pass
-
-        url = request.get_full_url() if hasattr(request, 'get_full_url') else str(request)
-
-        if 'api/token' in url:
-            return MockResponse('mock-token-12345')
-        if 'instance-id' in url:
-            return MockResponse('i-1234567890abcdef0')
-        if 'active-keys' in url:
-            return MockResponse('')
-        if 'availability-zone' in url:
-            return MockResponse('us-east-1a')
-        if 'services/domain' in url:
-            return MockResponse('amazonaws.com')
-        if 'signer-cert' in url:
+    out = ['', BANNER, f"Testing empty signer certificate (should exit 1)", BANNER]
+
+    def mock_imds_empty_cert(method, path, token=None, headers=None, retry=True):
+        """Mock _imds_request that returns empty certificate"""
+        if endpoint(path) == 'signer-cert':
             # Empty certificate
-            return MockResponse('')
-        return MockResponse('mock-data')
-
-    def mock_isfile_nitro(path):
-        if 'hypervisor/uuid' in path:
-            return False
-        if 'board_asset_tag' in path:
-            return True
-        return False
-
-    def mock_open_nitro(path, mode='r'):
-        class MockFile:
-            def read(self):
-                if 'board_asset_tag' in path:
-                    return 'i-1234567890abcdef0'
-                return ''
-            def strip(self):
-                return self.read().strip()
-            def __enter__(self):
-                return self
-            def __exit__(self, *args):
-                pass
-        return MockFile()
-
-    with mock.patch('urllib.request.urlopen', side_effect=mock_urlopen_empty_cert):
-        with mock.patch('os.path.isfile', side_effect=mock_isfile_nitro):
-            with mock.patch('builtins.open', side_effect=mock_open_nitro):
-                with mock.patch('pwd.getpwnam', side_effect=mock_getpwnam):
-                    with mock.patch('sys.argv', ['eic_curl.py', 'testuser']):
-                        import importlib
-                        if 'eic_curl' in sys.modules:
-                            importlib.reload(sys.modules['eic_curl'])
-                            eic_curl = sys.modules['eic_curl']
-                        else:
-                            import eic_curl
-
-                        try:
-                            eic_curl.main()
-                            print(f"\n✗ Empty cert test should have exited with 1!")
-                            return False
-                        except SystemExit as e:
-                            if e.code == 1:
-                                print(f"\n✓ Empty cert test correctly exited (exit 1)")
-                                return True
-                            else:
-                                print(f"\n✗ Empty cert test failed with unexpected code: {e.code}")
-                                return False
+            return b''
+        return mock_imds(method, path, token, headers, retry)
+
+    files = SCENARIOS['nitro']
+
+    reset_eic_state()
+    with swap_attrs({(eic_curl, '_imds_request'): mock_imds_empty_cert,
+                     (builtins, 'open'): make_open(files),
+                     (pwd, 'getpwnam'): mock_getpwnam,
+                     (sys, 'argv'): ['eic_curl.py', 'testuser']}):
+        try:
+            run_main()
+            out.append(f"\n✗ Empty cert test should have exited with 1!")
+            passed = False
+        except SystemExit as e:
+            if e.code == 1:
+                out.append(f"\n✓ Empty cert test correctly exited (exit 1)")
+                passed = True
+            else:
+                out.append(f"\n✗ Empty cert test failed with unexpected code: {e.code}")
+                passed = False
+    emit(out)
+    return passed
 
 
 def run_test_no_files():
     """Run test when no EC2 verification files exist (not an EC2 instance)"""
-    print(f"\n{'='*60}")
-    print(f"Testing non-EC2 instance (no files - should fail)")
-    print('='*60)
-
-    def mock_isfile_none(path):
-        return False  # No files exist
-
-    def mock_open_none(path, mode='r'):
-        raise IOError("File not found")
-
-    with mock.patch('urllib.request.urlopen', side_effect=mock_urlopen):
-        with mock.patch('os.path.isfile', side_effect=mock_isfile_none):
-            with mock.patch('builtins.open', side_effect=mock_open_none):
-                with mock.patch('pwd.getpwnam', side_effect=mock_getpwnam):
-                    with mock.patch('sys.argv', ['eic_curl.py', 'testuser']):
-                        import importlib
-                        if 'eic_curl' in sys.modules:
-                            importlib.reload(sys.modules['eic_curl'])
-                            eic_curl = sys.modules['eic_curl']
-                        else:
-                            import eic_curl
-
-                        try:
-                            eic_curl.main()
-                            print(f"\n✗ No-files test should have failed but didn't!")
-                            return False
-                        except SystemExit as e:
-                            if e.code == 0:
-                                print(f"\n✓ No-files test correctly rejected (exit 0)")
-                                return True
-                            else:
-                                print(f"\n✗ No-files test failed with unexpected code: {e.code}")
-                                return False
+    out = ['', BANNER, f"Testing non-EC2 instance (no files - should fail)", BANNER]
+
+    files = SCENARIOS['none']
+
+    reset_eic_state()
+    with swap_attrs({(eic_curl, '_imds_request'): mock_imds,
+                     (builtins, 'open'): make_open(files),
+                     (pwd, 'getpwnam'): mock_getpwnam,
+                     (sys, 'argv'): ['eic_curl.py', 'testuser']}):
+        try:
+            run_main()
+            out.append(f"\n✗ No-files test should have failed but didn't!")
+            passed = False
+        except SystemExit as e:
+            if e.code == 0:
+                out.append(f"\n✓ No-files test correctly rejected (exit 0)")
+                passed = True
+            else:
+                out.append(f"\n✗ No-files test failed with unexpected code: {e.code}")
+                passed = False
+    emit(out)
+    return passed
+
+
+def run_test_token_cache():
+    """Test token cache round-trip, expiry, and 401 invalidation"""
+    out = ['', BANNER, "Testing token cache (round-trip, expiry, 401)", BANNER]
+
+    reset_eic_state()
+    passed = True
+
+    # A fresh entry is served straight from the cache, no IMDS fetch
+    eic_curl.write_cached_token('cached-token',
+                                int(time.time()) + eic_curl.TOKEN_TTL_SECONDS)
+    with swap_attrs({(eic_curl, '_imds_request'): mock_imds}):
+        token = eic_curl.fetch_token()
+    if token == 'cached-token':
+        out.append("✓ fresh cache entry served")
+    else:
+        out.append(f"✗ expected cached token, got: {token}")
+        passed = False
+
+    # An expired entry is ignored; the fresh token replaces it
+    eic_curl.write_cached_token('stale-token', int(time.time()) - 1)
+    with swap_attrs({(eic_curl, '_imds_request'): mock_imds}):
+        token = eic_curl.fetch_token()
+    if token == TOKEN.decode() and eic_curl.read_cached_token() == token:
+        out.append("✓ expired entry refetched and cache rewritten")
+    else:
+        out.append(f"✗ expired entry not refreshed, got: {token}")
+        passed = False
+
+    # A 401 on a GET must drop the cached token and retry with a fresh one
+    class MockIMDSResponse:
+        """Stand-in for an http.client response"""
+        __slots__ = ('status', 'data')
+        reason = ''
+        headers = {}
+
+        def __init__(self, status, data):
+            self.status = status
+            self.data = data
+
+        def read(self):
+            return self.data
+
+    class MockIMDSConn:
+        """Scripted connection: rejects the bad token, accepts a fresh one"""
+        def __init__(self):
+            self.sent = None
+
+        def request(self, method, path, headers=None):
+            self.sent = (method, headers or {})
+
+        def getresponse(self):
+            method, headers = self.sent
+            if method == 'PUT':
+                return MockIMDSResponse(200, b'fresh-token')
+            if headers.get(eic_curl.TOKEN_HEADER) == 'fresh-token':
+                return MockIMDSResponse(200, b'payload')
+            return MockIMDSResponse(401, b'')
+
+        def close(self):
+            pass
+
+    eic_curl.write_cached_token('bad-token',
+                                int(time.time()) + eic_curl.TOKEN_TTL_SECONDS)
+    conn = MockIMDSConn()
+    with swap_attrs({(eic_curl, '_imds_connection'): lambda: conn}):
+        body = eic_curl._imds_request('GET', '/latest/meta-data/instance-id/',
+                                      eic_curl.fetch_token())
+    if body == b'payload' and eic_curl.read_cached_token() == 'fresh-token':
+        out.append("✓ 401 dropped the bad entry and retried with a fresh token")
+    else:
+        out.append(f"✗ 401 retry failed: body={body}, "
+                   f"cache={eic_curl.read_cached_token()}")
+        passed = False
+
+    # Remove the scratch cache this test wrote
+    eic_curl.invalidate_cached_token()
+    try:
+        os.unlink(eic_curl.TOKEN_CACHE_PATH + '.lock')
+    except OSError:
+        pass
+
+    emit(out)
+    return passed
 
 
 def run_test(instance_type):
     """Run test for a specific instance type"""
-    print(f"\n{'='*60}")
-    print(f"Testing {instance_type} instance type")
-    print('='*60)
-
-    # Mock file system checks
-    def mock_isfile_nitro(path):
-        """Mock os.path.isfile for Nitro instance"""
-        if 'hypervisor/uuid' in path:
-            return False  # Nitro: no Xen file
-        if 'board_asset_tag' in path:
-            return True  # Nitro: board_asset_tag exists
-        return False
-
-    def mock_isfile_xen(path):
-        """Mock os.path.isfile for Xen instance"""
-        if 'hypervisor/uuid' in path:
-            return True  # Xen: hypervisor/uuid exists
-        if 'board_asset_tag' in path:
-            return False  # Xen: no board_asset_tag
-        return False
-
-    def mock_open_nitro(path, mode='r'):
-        """Mock open() for Nitro instance"""
-        class MockFile:
-            def read(self):
-                if 'board_asset_tag' in path:
-                    return 'i-1234567890abcdef0'
-                return ''
-
-            def write(self, data):
-                # Mock write operation for OCSP staples
-                return len(data) if isinstance(data, (bytes, str)) else 0
-
-            def strip(self):
-                return self.read().strip()
-
-            def __enter__(self):
-                return self
-
-            def __exit__(self, *args):
-                pass
-
-        return MockFile()
-
-    def mock_open_xen(path, mode='r'):
-        """Mock open() for Xen instance"""
-        class MockFile:
-            def read(self):
-                if 'hypervisor/uuid' in path:
-                    return 'ec2abcdef-1234-5678-90ab-cdef12345678'
-                return ''
-
-            def write(self, data):
-                # Mock write operation for OCSP staples
-                return len(data) if isinstance(data, (bytes, str)) else 0
-
-            def strip(self):
-                return self.read().strip()
-
-            def __enter__(self):
-                return self
-
-            def __exit__(self, *args):
-                pass
-
-        return MockFile()
-
-    # Select mocks based on instance type
-    if instance_type == "Nitro":
-        mock_isfile_func = mock_isfile_nitro
-        mock_open_func = mock_open_nitro
-    else:  # Xen
-        mock_isfile_func = mock_isfile_xen
-        mock_open_func = mock_open_xen
+    out = ['', BANNER, f"Testing {instance_type} instance type", BANNER]
 
-    # Apply all patches
-    with mock.patch('urllib.request.urlopen', side_effect=mock_urlopen):
-        with mock.patch('os.path.isfile', side_effect=mock_isfile_func):
-            with mock.patch('builtins.open', side_effect=mock_open_func):
-                with mock.patch('pwd.getpwnam', side_effect=mock_getpwnam):
-                    with mock.patch('os.chmod'):  # Mock chmod for OCSP staples
-                        with mock.patch('sys.argv', ['eic_curl.py', 'testuser']):
-                            # Import fresh copy of module
-                            import importlib
-                            if 'eic_curl' in sys.modules:
-                                importlib.reload(sys.modules['eic_curl'])
-                                eic_curl = sys.modules['eic_curl']
-                            else:
-                                import eic_curl
-
-                            try:
-                                eic_curl.main()
-                                print(f"\n✓ {instance_type} test completed successfully!")
-                                return True
-                            except SystemExit as e:
-                                if e.code == 0:
-                                    print(f"\n✓ {instance_type} test completed (exit code {e.code})")
-                                    return True
-                                else:
-                                    print(f"\n✗ {instance_type} test failed with exit code: {e.code}")
-                                    return False
-
-
-# Run tests for both instance types
-if len(sys.argv) > 1:
-    # Allow running specific test
-    test_type = sys.argv[1]
-    valid_tests = ["extract-region", "nitro", "xen", "nitro-invalid", "xen-invalid", "no-files", "user-not-exists", "no-active-keys", "invalid-az", "invalid-domain", "empty-cert"]
-
-    if test_type.lower() not in valid_tests:
-        print(f"Invalid test type: {test_type}")
-        print(f"Valid options: {', '.join(valid_tests)}")
-        sys.exit(1)
+    files = SCENARIOS['nitro' if instance_type == "Nitro" else 'xen']
 
-    print(f"Running single test: {test_type}")
-
-    if test_type.lower() == "extract-region":
-        result = run_test_extract_region()
-    elif test_type.lower() == "nitro":
-        result = run_test("Nitro")
-    elif test_type.lower() == "xen":
-        result = run_test("Xen")
-    elif test_type.lower() == "nitro-invalid":
-        result = run_test_invalid("Nitro")
-    elif test_type.lower() == "xen-invalid":
-        result = run_test_invalid("Xen")
-    elif test_type.lower() == "no-files":
-        result = run_test_no_files()
-    elif test_type.lower() == "user-not-exists":
-        result = run_test_user_not_exists()
-    elif test_type.lower() == "no-active-keys":
-        result = run_test_no_active_keys()
-    elif test_type.lower() == "invalid-az":
-        result = run_test_invalid_az()
-    elif test_type.lower() == "invalid-domain":
-        result = run_test_invalid_domain()
-    elif test_type.lower() == "empty-cert":
-        result = run_test_empty_cert()
-
-    sys.exit(0 if result else 1)
-else:
-    # Run all tests
+    # Apply all patches
+    reset_eic_state()
+    with swap_attrs({(eic_curl, '_imds_request'): mock_imds,
+                     (builtins, 'open'): make_open(files),
+                     (pwd, 'getpwnam'): mock_getpwnam,
+                     (sys, 'argv'): ['eic_curl.py', 'testuser']}):
+        try:
+            run_main()
+            out.append(f"\n✓ {instance_type} test completed successfully!")
+            passed = True
+        except SystemExit as e:
+            if e.code == 0:
+                out.append(f"\n✓ {instance_type} test completed (exit code {e.code})")
+                passed = True
+            else:
+                out.append(f"\n✗ {instance_type} test failed with exit code: {e.code}")
+                passed = False
+    emit(out)
+    return passed
+
+
+# Dispatch tables: CLI name -> test callable / summary label
+TEST_FUNCS = {
+    'extract-region': run_test_extract_region,
+    'nitro': partial(run_test, "Nitro"),
+    'xen': partial(run_test, "Xen"),
+    'nitro-invalid': partial(run_test_invalid, "Nitro"),
+    'xen-invalid': partial(run_test_invalid, "Xen"),
+    'no-files': run_test_no_files,
+    'user-not-exists': run_test_user_not_exists,
+    'no-active-keys': run_test_no_active_keys,
+    'invalid-az': run_test_invalid_az,
+    'invalid-domain': run_test_invalid_domain,
+    'empty-cert': run_test_empty_cert,
+    'token-cache': run_test_token_cache,
+}
+
+TEST_LABELS = {
+    'extract-region': 'Extract region',
+    'nitro': 'Nitro valid',
+    'xen': 'Xen valid',
+    'nitro-invalid': 'Nitro invalid',
+    'xen-invalid': 'Xen invalid',
+    'no-files': 'No files',
+    'user-not-exists': 'User not exists',
+    'no-active-keys': 'No active keys',
+    'invalid-az': 'Invalid AZ',
+    'invalid-domain': 'Invalid domain',
+    'empty-cert': 'Empty cert',
+    'token-cache': 'Token cache',
+}
+
+
+def run_one(name):
+    """Run one named subtest in a worker process; returns (name, passed)"""
+    return name, TEST_FUNCS[name]()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # Allow running specific test
+        test_type = sys.argv[1]
+
+        if test_type.lower() not in TEST_FUNCS:
+            print(f"Invalid test type: {test_type}")
+            print(f"Valid options: {', '.join(TEST_FUNCS)}")
+            sys.exit(1)
+
+        print(f"Running single test: {test_type}")
+        sys.exit(0 if TEST_FUNCS[test_type.lower()]() else 1)
+
+    # Run all tests; the subtests are independent, so fan them out across
+    # worker processes and collect (name, passed) pairs in table order
     print("Running tests with mocked IMDS and EC2 instance files...")
 
-    extract_region_result = run_test_extract_region()
-    nitro_result = run_test("Nitro")
-    xen_result = run_test("Xen")
-    nitro_invalid_result = run_test_invalid("Nitro")
-    xen_invalid_result = run_test_invalid("Xen")
-    no_files_result = run_test_no_files()
-    user_not_exists_result = run_test_user_not_exists()
-    no_active_keys_result = run_test_no_active_keys()
-    invalid_az_result = run_test_invalid_az()
-    invalid_domain_result = run_test_invalid_domain()
-    empty_cert_result = run_test_empty_cert()
+    with ProcessPoolExecutor() as pool:
+        results = list(pool.map(run_one, TEST_FUNCS))
 
     # Summary
-    print(f"\n{'='*60}")
-    print("Test Summary")
-    print('='*60)
-    print(f"Extract region:    {'✓ PASSED' if extract_region_result else '✗ FAILED'}")
-    print(f"Nitro valid:       {'✓ PASSED' if nitro_result else '✗ FAILED'}")
-    print(f"Xen valid:         {'✓ PASSED' if xen_result else '✗ FAILED'}")
-    print(f"Nitro invalid:     {'✓ PASSED' if nitro_invalid_result else '✗ FAILED'}")
-    print(f"Xen invalid:       {'✓ PASSED' if xen_invalid_result else '✗ FAILED'}")
-    print(f"No files:          {'✓ PASSED' if no_files_result else '✗ FAILED'}")
-    print(f"User not exists:   {'✓ PASSED' if user_not_exists_result else '✗ FAILED'}")
-    print(f"No active keys:    {'✓ PASSED' if no_active_keys_result else '✗ FAILED'}")
-    print(f"Invalid AZ:        {'✓ PASSED' if invalid_az_result else '✗ FAILED'}")
-    print(f"Invalid domain:    {'✓ PASSED' if invalid_domain_result else '✗ FAILED'}")
-    print(f"Empty cert:        {'✓ PASSED' if empty_cert_result else '✗ FAILED'}")
-    print('='*60)
-
-    all_passed = all([extract_region_result, nitro_result, xen_result, nitro_invalid_result, xen_invalid_result, no_files_result, user_not_exists_result, no_active_keys_result, invalid_az_result, invalid_domain_result, empty_cert_result])
+    out = ['', BANNER, "Test Summary", BANNER]
+    for name, passed in results:
+        out.append(f"{TEST_LABELS[name] + ':':<19}{'✓ PASSED' if passed else '✗ FAILED'}")
+    out.append(BANNER)
+    emit(out)
 
-    if all_passed:
+    if all(passed for _, passed in results):
         print("\n✓ All tests passed!")
         sys.exit(0)
     else: